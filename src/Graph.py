@@ -11,6 +11,7 @@ from Link import Link
 from Move import Move
 from Phase import Phase
 from Path import Path
+from path_store import PathStore
 
 OD = tuple[Node, Node]
 
@@ -58,12 +59,15 @@ class Graph:
     def __getattr__(self, attr):
         """
         If any attribute is not initialized then attribute will be set to set(_attribute.values()) and returned.
-        Failing would raise AttributeError
+        Failing would raise AttributeError, which also lets copy and pickle find their hooks on a partially
+        restored Graph.
         """
         if attr in self.__dict__:
             return self.__dict__[attr]                           # if attribute is already present return attribute
         elif f"_{attr}" in self.__dict__:
             setattr(self, attr, set(self.__dict__[f"_{attr}"].values()))
+        else:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {attr!r}")
 
         return self.__dict__[attr]
 
@@ -210,6 +214,33 @@ class Graph:
 
         return turn_proportions
 
+    def update_demand(self, demand: dict[OD, float], store: PathStore = None) -> None:
+        """
+        Replaces the od demand and updates the path flows, exogenous demands and turn proportions. The link and turn
+        flows are summed in one pass over the paths of store, which is created from the graph if not given.
+        """
+        self.demand = demand
+        for (r, s), paths in self.paths.items():
+            for path in paths:
+                path.flow = path.proportion * self.demand.get((r, s), 0)
+
+        if store is None:
+            store = PathStore.from_graph(self)
+        else:
+            store.update_flows(demand)
+        link_flows, turn_flows = store.link_flow_array(), store.turn_flows()
+
+        # Entry links are only used as the first link of a path, so their link flow is the demand they bring in
+        self.exogenous_demands = {link: link_flows[store.link_index[link.id]] for link in self.entry_links}
+
+        self.turn_proportions = {}
+        for node in self.signal_nodes:
+            for move in self.allowed_moves(node):
+                i, j = store.link_index[move.in_link.id], store.link_index[move.out_link.id]
+                move.numerator, move.denominator = turn_flows.get((i, j), 0), link_flows[i]
+                self.turn_proportions[(move.in_link, move.out_link)] = \
+                    move.numerator / move.denominator if move.denominator > 0 else 0
+
     def forward_star(self, node: Node, force: bool = False) -> Iterable[Link]:
         """Returns the forward star of the node"""
         return self.__star(node, 'tail', force)
@@ -1,4 +1,5 @@
 from copy import deepcopy
+from itertools import islice
 from Node import Node
 from Link import Link
 
@@ -19,7 +20,7 @@ class Path:
         return f"Path <{self.id=}>"
 
     def __iter__(self):
-        for upstream, downstream in zip(self._path[:-1], self._path[1:]):
+        for upstream, downstream in zip(self._path, islice(self._path, 1, None)):
             yield upstream, downstream
 
     def __getitem__(self, item: int):
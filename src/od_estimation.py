@@ -0,0 +1,221 @@
+#! python3
+
+from array import array
+
+from Graph import Graph, OD
+from Node import Node
+from path_store import PathStore
+
+
+class SparseMatrix:
+    """Compressed sparse row matrix backed by flat arrays."""
+
+    def __init__(self, num_rows: int, num_columns: int, rows: list[dict[int, float]]):
+        self.shape = (num_rows, num_columns)
+        self.indptr = array('q', [0])
+        self.indices = array('i')
+        self.data = array('d')
+        for row in rows:
+            for column in sorted(row):
+                self.indices.append(column)
+                self.data.append(row[column])
+            self.indptr.append(len(self.indices))
+
+    def __repr__(self):
+        return f"<SparseMatrix shape={self.shape} nnz={len(self.data)}>"
+
+    def dot(self, x: array) -> array:
+        """Returns the product of the matrix with the vector x"""
+        y = array('d', bytes(8 * self.shape[0]))
+        indptr, indices, data = self.indptr, self.indices, self.data
+        for i in range(self.shape[0]):
+            y[i] = sum(data[n] * x[indices[n]] for n in range(indptr[i], indptr[i + 1]))
+        return y
+
+    def tdot(self, y: array) -> array:
+        """Returns the product of the transposed matrix with the vector y"""
+        x = array('d', bytes(8 * self.shape[1]))
+        indptr, indices, data = self.indptr, self.indices, self.data
+        for i in range(self.shape[0]):
+            if not y[i]:
+                continue
+            for n in range(indptr[i], indptr[i + 1]):
+                x[indices[n]] += data[n] * y[i]
+        return x
+
+
+class ODEstimator:
+    def __init__(self, net: Graph, counts: dict[int, float], store: PathStore = None):
+        """
+        :param net: network object.
+        :param counts: observed link counts (demand/hour) keyed by link id.
+        :param store: path store of the network, created from net if not given.
+        """
+        unknown = set(counts) - {link.id for link in net.links}
+        if unknown:
+            raise KeyError(f"Counts given for links {sorted(unknown)} that are not in {net}.")
+
+        self.G = net
+        self.store: PathStore = store if store is not None else PathStore.from_graph(net)
+
+        self.count_links: list[int] = sorted(counts)                                # row index -> link id
+        self.counts = array('d', [counts[link_id] for link_id in self.count_links])
+        self.od_pairs: list[OD] = [od for od in net.paths if net.paths[od]]        # column index -> od pair
+
+        self.incidence: SparseMatrix = self.__load_path_link_incidence()
+        self.assignment: SparseMatrix = self.__load_od_assignment()
+
+    def __repr__(self):
+        return f"<ODEstimator of {self.G.name} counts={len(self.count_links)} ods={len(self.od_pairs)}>"
+
+    def __load_path_link_incidence(self) -> SparseMatrix:
+        """Returns the counted link x path incidence matrix"""
+        row_of = {link_id: row for row, link_id in enumerate(self.count_links)}
+        rows: list[dict[int, float]] = [{} for _ in self.count_links]
+        for path in self.store:
+            for link_index in self.store.link_indices(path.index):
+                row = row_of.get(self.store.links[link_index].id)
+                if row is not None:
+                    rows[row][path.index] = rows[row].get(path.index, 0) + 1
+        return SparseMatrix(len(self.count_links), len(self.store), rows)
+
+    def __load_od_assignment(self) -> SparseMatrix:
+        """
+        Returns the counted link x od matrix holding the share of the demand of each od pair that uses each link,
+        which is the path link incidence matrix times the path proportions summed per od pair.
+        """
+        column_of_path = array('i', [-1] * len(self.store))
+        for column, (r, s) in enumerate(self.od_pairs):
+            for path in self.store.paths(r, s):
+                column_of_path[path.index] = column
+
+        rows: list[dict[int, float]] = []
+        incidence = self.incidence
+        for row in range(incidence.shape[0]):
+            shares: dict[int, float] = {}
+            for n in range(incidence.indptr[row], incidence.indptr[row + 1]):
+                path_index = incidence.indices[n]
+                column = column_of_path[path_index]
+                if column >= 0 and self.store.proportions[path_index]:
+                    shares[column] = shares.get(column, 0) + incidence.data[n] * self.store.proportions[path_index]
+            rows.append(shares)
+        return SparseMatrix(len(self.count_links), len(self.od_pairs), rows)
+
+    def demand_vector(self, demand: dict[OD, float] = None) -> array:
+        """Returns the demand of the od pairs in column order"""
+        demand = self.G.demand if demand is None else demand
+        return array('d', [demand.get(od, 0) for od in self.od_pairs])
+
+    def demand_dict(self, g: array) -> dict[OD, float]:
+        """Returns the network demand with the od pairs that have paths replaced by g"""
+        demand = dict(self.G.demand)
+        demand.update(zip(self.od_pairs, g))
+        return demand
+
+    def link_volumes(self, demand: dict[OD, float] = None) -> dict[int, float]:
+        """Returns the assigned volumes of the counted links"""
+        return dict(zip(self.count_links, self.assignment.dot(self.demand_vector(demand))))
+
+    def rmse(self, demand: dict[OD, float] = None) -> float:
+        """Returns the root mean squared error between the assigned volumes and the counts"""
+        volumes = self.assignment.dot(self.demand_vector(demand))
+        if not volumes:
+            return 0
+        return (sum((v - c) ** 2 for v, c in zip(volumes, self.counts)) / len(volumes)) ** 0.5
+
+    def __count_totals(self, end: str) -> dict[Node, float]:
+        """
+        Returns the counted totals of the zones whose connectors are all counted. end is 'tail' for the productions
+        of the origins and 'head' for the attractions of the destinations.
+        """
+        counts = dict(zip(self.count_links, self.counts))
+        connectors: dict[Node, list[int]] = {}
+        for link in (self.G.entry_links if end == 'tail' else self.G.exit_links):
+            connectors.setdefault(getattr(link, end), []).append(link.id)
+
+        return {zone: sum(counts[link_id] for link_id in link_ids) for zone, link_ids in connectors.items()
+                if all(link_id in counts for link_id in link_ids)}
+
+    def ipf(self, productions: dict[Node, float] = None, attractions: dict[Node, float] = None,
+            max_iter: int = 100, tol: float = 1e-6) -> dict[OD, float]:
+        """
+        Returns the demand balanced by iterative proportional fitting so that the origin and destination totals
+        match the productions and attractions. If they are not given they are taken from the counts of the zones
+        whose centroid connectors are all counted. Zones without a target are left unconstrained.
+        """
+        productions = self.__count_totals('tail') if productions is None else productions
+        attractions = self.__count_totals('head') if attractions is None else attractions
+
+        g = self.demand_vector()
+        rows: dict[Node, list[int]] = {}
+        columns: dict[Node, list[int]] = {}
+        for k, (r, s) in enumerate(self.od_pairs):
+            if r in productions:
+                rows.setdefault(r, []).append(k)
+            if s in attractions:
+                columns.setdefault(s, []).append(k)
+
+        for _ in range(max_iter):
+            error = 0
+            for totals, groups in [(productions, rows), (attractions, columns)]:
+                for zone, ks in groups.items():
+                    current = sum(g[k] for k in ks)
+                    if current <= 0:
+                        continue
+                    error = max(error, abs(current - totals[zone]) / max(totals[zone], 1))
+                    factor = totals[zone] / current
+                    for k in ks:
+                        g[k] *= factor
+            if error < tol:
+                break
+
+        return self.demand_dict(g)
+
+    def odme(self, demand: dict[OD, float] = None, max_iter: int = 50, tol: float = 1e-6) -> dict[OD, float]:
+        """
+        Returns the demand adjusted to the counts by minimizing the squared deviation between assigned volumes and
+        counts with the multiplicative gradient method of Spiess (1990). The od pattern of the starting demand is
+        kept: od pairs with zero demand stay zero and no demand becomes negative.
+        """
+        A = self.assignment
+        g = self.demand_vector(demand)
+
+        previous = None
+        for _ in range(max_iter):
+            residual = array('d', [v - c for v, c in zip(A.dot(g), self.counts)])
+            objective = sum(r * r for r in residual) / 2
+            if previous is not None and previous - objective <= tol * max(previous, 1):
+                break
+            previous = objective
+
+            gradient = A.tdot(residual)
+            direction = array('d', [-g_k * d_k for g_k, d_k in zip(g, gradient)])
+            volume_change = A.dot(direction)
+
+            denominator = sum(dv * dv for dv in volume_change)
+            if denominator == 0:
+                break
+            step = -sum(dv * r for dv, r in zip(volume_change, residual)) / denominator
+
+            # Largest step keeping every od demand non-negative
+            max_gradient = max((d_k for g_k, d_k in zip(g, gradient) if g_k > 0), default=0)
+            if max_gradient > 0:
+                step = min(step, 1 / max_gradient)
+
+            for k in range(len(g)):
+                g[k] = max(g[k] + step * direction[k], 0)
+
+        return self.demand_dict(g)
+
+    def apply(self, demand: dict[OD, float]) -> None:
+        """Writes the estimated demand back to the network and the path store"""
+        self.G.update_demand(demand, self.store)
+
+
+if __name__ == "__main__":
+    G = Graph(r"..\data")
+    observed: dict[int, float] = {}     # dict[link_id, count]
+    estimator = ODEstimator(G, observed)
+    estimated = estimator.odme(estimator.ipf())
+    print(f"rmse {estimator.rmse():.3f} -> {estimator.rmse(estimated):.3f}")
+    estimator.apply(estimated)
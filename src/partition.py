@@ -0,0 +1,246 @@
+#! python3
+
+from dataclasses import dataclass, field
+
+from Graph import Graph
+from Node import Node
+from Link import Link
+
+
+@dataclass
+class BoundaryLink:
+    link: Link
+    from_region: int    # region of the tail node
+    to_region: int      # region of the head node
+    flow: float         # total path flow on the link
+
+    def __repr__(self):
+        return f"<BoundaryLink={self.link.id} ({self.from_region} -> {self.to_region})>"
+
+
+@dataclass
+class Region:
+    id: int
+    nodes: set[Node] = field(default_factory=set)
+    links: set[Link] = field(default_factory=set)                   # links with both end nodes in the region
+    incoming: list[BoundaryLink] = field(default_factory=list)       # cut links whose head is in the region
+    outgoing: list[BoundaryLink] = field(default_factory=list)      # cut links whose tail is in the region
+    weight: float = 0
+
+    def __repr__(self):
+        return f"<Region={self.id} nodes={len(self.nodes)} links={len(self.links)}>"
+
+    def __hash__(self):
+        return hash(self.id)
+
+    @property
+    def boundary_links(self) -> list[BoundaryLink]:
+        """Returns the incoming and outgoing boundary links of the region"""
+        return self.incoming + self.outgoing
+
+
+@dataclass
+class Partition:
+    regions: dict[int, Region]
+    assignment: dict[int, int]          # dict[node_id, region_id]
+    cut_links: list[BoundaryLink]
+
+    def __len__(self):
+        return len(self.regions)
+
+    def __getitem__(self, region_id: int) -> Region:
+        return self.regions[region_id]
+
+    def region_of(self, node: Node) -> Region:
+        """Returns the region the node was assigned to"""
+        return self.regions[self.assignment[node.id]]
+
+    @property
+    def edge_cut(self) -> int:
+        """Returns the number of links crossing region boundaries"""
+        return len(self.cut_links)
+
+    @property
+    def imbalance(self) -> float:
+        """Returns the heaviest region weight relative to the average region weight"""
+        average = sum(region.weight for region in self.regions.values()) / len(self.regions)
+        return max(region.weight for region in self.regions.values()) / average if average > 0 else 0
+
+    def interface_table(self, region_id: int) -> dict[int, tuple[int, int, float]]:
+        """
+        Returns dict[link_id, (from_region, to_region, flow)] of the boundary links of the region. Flows on these
+        links are the only quantities that need to be exchanged with the neighbouring regions.
+        """
+        return {bl.link.id: (bl.from_region, bl.to_region, bl.flow) for bl in self.regions[region_id].boundary_links}
+
+
+class GraphPartitioner:
+    def __init__(self, net: Graph, k: int, flow_weight: float = 0.5, imbalance: float = 0.05,
+                 refinement_passes: int = 4):
+        """
+        :param net: network object.
+        :param k: number of regions.
+        :param flow_weight: share of the node weight coming from path flow, the rest comes from the link count.
+        :param imbalance: allowed excess of a region weight over the average region weight during refinement.
+        :param refinement_passes: maximum number of boundary refinement passes after the coordinate bisection.
+        """
+        if not 1 <= k <= len(net.nodes):
+            raise ValueError(f"Can not partition {len(net.nodes)} nodes into {k} regions.")
+        if not 0 <= flow_weight <= 1:
+            raise ValueError(f"flow_weight must be in [0, 1], got {flow_weight}.")
+
+        self.G = net
+        self.k = k
+        self.flow_weight = flow_weight
+        self.imbalance = imbalance
+        self.refinement_passes = refinement_passes
+
+        self.link_flows: dict[int, float] = self.__load_link_flows()
+        self.__neighbours: dict[int, list[int]] = self.__load_neighbours()
+        self.node_weights: dict[int, float] = self.__load_node_weights()
+
+    def __repr__(self):
+        return f"<GraphPartitioner of {self.G.name} k={self.k}>"
+
+    def __load_link_flows(self) -> dict[int, float]:
+        """Returns dict[link_id, flow] with the sum of the flows of all paths using the link"""
+        link_flows = {link.id: 0 for link in self.G.links}
+        for paths in self.G.paths.values():
+            for path in paths:
+                for link in path._path:
+                    link_flows[link.id] += path.flow
+        return link_flows
+
+    def __load_neighbours(self) -> dict[int, list[int]]:
+        """Returns the undirected adjacency of the node ids, one entry per incident link"""
+        neighbours = {node.id: [] for node in self.G.nodes}
+        for link in self.G.links:
+            neighbours[link.tail.id].append(link.head.id)
+            neighbours[link.head.id].append(link.tail.id)
+        return neighbours
+
+    def __load_node_weights(self) -> dict[int, float]:
+        """
+        Returns the node weights. Weight of a node is the blend of its share of the incident links and its share of
+        the flow entering or leaving it, so the weights of all nodes sum to 1.
+        """
+        node_flows = {node_id: 0 for node_id in self.__neighbours}
+        for link in self.G.links:
+            node_flows[link.tail.id] += self.link_flows[link.id]
+            node_flows[link.head.id] += self.link_flows[link.id]
+
+        total_degree = sum(len(adjacent) for adjacent in self.__neighbours.values()) or 1
+        total_flow = sum(node_flows.values())
+        flow_weight = self.flow_weight if total_flow > 0 else 0
+
+        return {node_id: (1 - flow_weight) * len(self.__neighbours[node_id]) / total_degree
+                         + (flow_weight * node_flows[node_id] / total_flow if flow_weight else 0)
+                for node_id in self.__neighbours}
+
+    def __bisect(self, node_ids: list[int], k: int, parts: list[list[int]]) -> None:
+        """
+        Recursively splits node_ids along the coordinate axis of larger spread, at the weighted position that gives
+        the two halves weights proportional to the number of regions they will be split into.
+        """
+        if k == 1:
+            parts.append(node_ids)
+            return
+
+        nodes = self.G._nodes
+        xs = [nodes[node_id].x for node_id in node_ids]
+        ys = [nodes[node_id].y for node_id in node_ids]
+        axis = 'x' if max(xs) - min(xs) >= max(ys) - min(ys) else 'y'
+        node_ids = sorted(node_ids, key=lambda node_id: (getattr(nodes[node_id], axis), node_id))
+
+        k_left = k // 2
+        target = sum(self.node_weights[node_id] for node_id in node_ids) * k_left / k
+
+        split, cumulative = 0, 0
+        for split, node_id in enumerate(node_ids, start=1):
+            cumulative += self.node_weights[node_id]
+            if cumulative >= target:
+                # Keep the node on whichever side lands the cumulative weight closer to the target
+                if cumulative - target > self.node_weights[node_id] / 2:
+                    split -= 1
+                break
+
+        # Both halves need at least one node per region
+        split = min(max(split, k_left), len(node_ids) - (k - k_left))
+
+        self.__bisect(node_ids[:split], k_left, parts)
+        self.__bisect(node_ids[split:], k - k_left, parts)
+
+    def __refine(self, assignment: dict[int, int]) -> None:
+        """
+        Greedily moves boundary nodes to the neighbouring region holding most of their links while it reduces the
+        edge cut and keeps the receiving region within the allowed imbalance.
+        """
+        region_weights = [0.0] * self.k
+        region_sizes = [0] * self.k
+        for node_id, region_id in assignment.items():
+            region_weights[region_id] += self.node_weights[node_id]
+            region_sizes[region_id] += 1
+        max_weight = (1 + self.imbalance) * sum(region_weights) / self.k
+
+        for _ in range(self.refinement_passes):
+            moved = False
+            for node_id in sorted(assignment):
+                current = assignment[node_id]
+                if region_sizes[current] == 1:
+                    continue
+
+                counts: dict[int, int] = {}
+                for adjacent in self.__neighbours[node_id]:
+                    counts.setdefault(assignment[adjacent], 0)
+                    counts[assignment[adjacent]] += 1
+
+                weight = self.node_weights[node_id]
+                best, best_gain = current, 0
+                for region_id, count in sorted(counts.items()):
+                    gain = count - counts.get(current, 0)
+                    if region_id != current and gain > best_gain and region_weights[region_id] + weight <= max_weight:
+                        best, best_gain = region_id, gain
+
+                if best != current:
+                    assignment[node_id] = best
+                    region_weights[current] -= weight
+                    region_weights[best] += weight
+                    region_sizes[current] -= 1
+                    region_sizes[best] += 1
+                    moved = True
+
+            if not moved:
+                break
+
+    def partition(self) -> Partition:
+        """Returns the network partitioned into k regions with the boundary link interface tables"""
+        parts: list[list[int]] = []
+        self.__bisect(sorted(self.__neighbours), self.k, parts)
+        assignment = {node_id: region_id for region_id, part in enumerate(parts) for node_id in part}
+        self.__refine(assignment)
+
+        regions = {region_id: Region(region_id) for region_id in range(self.k)}
+        for node_id, region_id in assignment.items():
+            regions[region_id].nodes.add(self.G._nodes[node_id])
+            regions[region_id].weight += self.node_weights[node_id]
+
+        cut_links = []
+        for link in sorted(self.G.links, key=lambda link: link.id):
+            i, j = assignment[link.tail.id], assignment[link.head.id]
+            if i == j:
+                regions[i].links.add(link)
+                continue
+            boundary_link = BoundaryLink(link, i, j, self.link_flows[link.id])
+            regions[i].outgoing.append(boundary_link)
+            regions[j].incoming.append(boundary_link)
+            cut_links.append(boundary_link)
+
+        return Partition(regions, assignment, cut_links)
+
+
+if __name__ == "__main__":
+    G = Graph(r"..\data")
+    P = GraphPartitioner(G, k=8).partition()
+    for region in P.regions.values():
+        print(region, f"weight={region.weight:.3f}", f"boundary={len(region.boundary_links)}")
+    print(f"{P.edge_cut = }, {P.imbalance = :.3f}")
@@ -0,0 +1,413 @@
+#! python3
+
+import os
+import sys
+from array import array
+from ast import literal_eval
+from typing import Iterable, Sequence, Union
+
+from Node import Node
+from Link import Link
+from Path import Path
+
+
+def index_by_id(items: Iterable) -> tuple[list, dict[int, int]]:
+    """Returns the items sorted by id (index -> item) and dict[item id, index]"""
+    items = sorted(items, key=lambda item: item.id)
+    return items, {item.id: i for i, item in enumerate(items)}
+
+
+def group_indices(keys: Sequence[int], num_groups: int, values: Sequence[int] = None) -> tuple[array, array]:
+    """
+    Groups values (the positions of the keys by default) by their key with a counting sort. Returns offsets and the
+    grouped values in CSR form, the values with key k are grouped[offsets[k]:offsets[k + 1]].
+    """
+    offsets = array('q', bytes(8 * (num_groups + 1)))
+    for key in keys:
+        offsets[key + 1] += 1
+    for k in range(num_groups):
+        offsets[k + 1] += offsets[k]
+
+    grouped = array('i', bytes(4 * len(keys)))
+    position = array('q', offsets)
+    for i, key in enumerate(keys):
+        grouped[position[key]] = values[i] if values is not None else i
+        position[key] += 1
+    return offsets, grouped
+
+
+class PathView:
+    """Read only view of one path of a PathStore. Can be used wherever a Path is expected."""
+
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store: "PathStore", index: int):
+        self.store = store
+        self.index = index
+
+    def __repr__(self):
+        return f"Path <self.id={self.id}>"
+
+    def __iter__(self):
+        links = self.store.links
+        link_indices = self.store.link_indices(self.index)
+        for upstream, downstream in zip(link_indices[:-1], link_indices[1:]):
+            yield links[upstream], links[downstream]
+
+    def __getitem__(self, item: int) -> Link:
+        return self.store.links[self.store.link_indices(self.index)[item]]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (PathView, Path)):
+            return NotImplemented
+        return self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __len__(self):
+        return self.store.offsets[self.index + 1] - self.store.offsets[self.index]
+
+    @property
+    def id(self) -> int:
+        return self.store.path_ids[self.index]
+
+    @property
+    def proportion(self) -> float:
+        return self.store.proportions[self.index]
+
+    @property
+    def flow(self) -> float:
+        return self.store.flows[self.index]
+
+    @property
+    def origin(self) -> Node:
+        return self.store.links[self.store.link_indices(self.index)[0]].tail
+
+    @property
+    def destination(self) -> Node:
+        return self.store.links[self.store.link_indices(self.index)[-1]].head
+
+    @property
+    def _path(self) -> tuple[Link]:
+        return tuple(self.store.links[i] for i in self.store.link_indices(self.index))
+
+    def get_index(self, link: Link):
+        """Returns the index of input link in path"""
+        link_index = self.store.link_index.get(link.id)
+        for i, edge in enumerate(self.store.link_indices(self.index)):
+            if edge == link_index:
+                return i
+        return None
+
+
+class PrefixTrie:
+    """
+    Prefix trie of link index sequences. The roots of the trie are the origin connectors, so paths from the same
+    origin connector share the trie nodes of their common prefix. Trie node n stands for the link link[n] reached
+    from trie node parent[n] (-1 for the roots), a sequence is stored as the trie node of its last link. Children
+    always come after their parent.
+    """
+
+    def __init__(self):
+        self.parent = array('i')
+        self.link = array('i')
+
+    def __repr__(self):
+        return f"<PrefixTrie nodes={len(self)}>"
+
+    def __len__(self):
+        return len(self.link)
+
+    def add_group(self, sequences: Sequence[array]) -> array:
+        """
+        Adds the sequences of link indices, which should be all the sequences starting with the same origin connector,
+        and returns the trie node of the last link of each. The sequences are added in sorted order, so the nodes
+        shared with the previous sequence are found by comparing with it instead of looking up the children.
+        """
+        leaves = array('i', bytes(4 * len(sequences)))
+        previous: Sequence[int] = ()
+        nodes = array('i')                                              # trie nodes of the previous sequence
+        for i in sorted(range(len(sequences)), key=sequences.__getitem__):
+            sequence = sequences[i]
+            shared = 0
+            while shared < min(len(sequence), len(previous)) and sequence[shared] == previous[shared]:
+                shared += 1
+            del nodes[shared:]
+            for link_index in sequence[shared:]:
+                self.parent.append(nodes[-1] if nodes else -1)
+                self.link.append(link_index)
+                nodes.append(len(self.link) - 1)
+            leaves[i] = nodes[-1]
+            previous = sequence
+        return leaves
+
+    def link_indices(self, node: int) -> array:
+        """Returns the link indices of the sequence ending at the trie node"""
+        link_indices = array('i')
+        while node >= 0:
+            link_indices.append(self.link[node])
+            node = self.parent[node]
+        link_indices.reverse()
+        return link_indices
+
+    @property
+    def nbytes(self) -> int:
+        """Returns the memory used by the arrays of the trie"""
+        return sum(a.itemsize * len(a) for a in [self.parent, self.link])
+
+
+class PathStore:
+    """
+    Stores path sets in flat arrays. By default the link indices of the paths are stored as int32 arrays with
+    offsets (CSR), path i uses the links link_indices[offsets[i]:offsets[i + 1]]. With trie=True they are moved to
+    a PrefixTrie when the store is frozen and offsets then only give the path lengths. Per path values are kept in
+    parallel arrays.
+    """
+
+    def __init__(self, links: Iterable[Link], trie: bool = False):
+        self.links: list[Link]                                      # link index -> Link
+        self.link_index: dict[int, int]
+        self.links, self.link_index = index_by_id(links)
+
+        self.path_ids = array('q')
+        self.proportions = array('d')
+        self.flows = array('d')
+        self.offsets = array('q', [0])
+        self.trie = trie
+        self._link_indices: Union[array, None] = array('i')         # dropped by freeze() with trie=True
+        self._trie: Union[PrefixTrie, None] = None                  # built by freeze() with trie=True
+        self._leaves = array('i')                                   # path index -> trie node
+
+        self._path_index: dict[int, int] = {}                       # dict[path_id, path index]
+        self._od_paths: dict[tuple[int, int], array] = {}           # dict[(origin_id, destination_id), path indices]
+        self.frozen = False
+
+        self.__link_offsets: Union[array, None] = None              # link -> paths index, built when required
+        self.__link_paths: Union[array, None] = None
+
+    def __repr__(self):
+        return f"<PathStore paths={len(self)} links={self.offsets[-1]}{' trie' if self.trie else ''}>"
+
+    def __len__(self):
+        return len(self.path_ids)
+
+    def __getitem__(self, index: int) -> PathView:
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"Path index {index} out of range.")
+        return PathView(self, index % len(self))
+
+    def __iter__(self) -> Iterable[PathView]:
+        for index in range(len(self)):
+            yield PathView(self, index)
+
+    @classmethod
+    def from_graph(cls, net, trie: bool = False) -> "PathStore":
+        """Returns the frozen path store of all the paths of the network"""
+        store = cls(net.links, trie)
+        for paths in net.paths.values():
+            for path in paths:
+                store.append(path.id, [link.id for link in path._path], path.proportion, path.flow)
+        store.freeze()
+        return store
+
+    @classmethod
+    def from_file(cls, dir_path: str, links: Iterable[Link], demand: dict[tuple[Node, Node], float] = None,
+                  trie: bool = False) -> "PathStore":
+        """
+        Returns the frozen path store loaded from paths.txt in the given dir_path without creating Path objects. Path
+        flows are set from demand when it is given.
+        """
+        store = cls(links, trie)
+        with open(os.path.join(dir_path, 'paths.txt')) as path_file:
+            for line_no, line in enumerate(path_file):
+                if line_no == 0 and not line.split()[0].isdigit():
+                    continue                                # paths.txt may or may not start with a header
+                path_id, num_links, path_proportion, *path_of_link_ids = [literal_eval(arg) for arg in line.split()]
+                assert len(path_of_link_ids) == num_links, f"Error in path {path_id}: Path length = " \
+                                                           f"{len(path_of_link_ids)} does not match number of links " \
+                                                           f"{num_links}."
+                store.append(path_id, path_of_link_ids, path_proportion)
+        store.freeze()
+
+        if demand is not None:
+            store.update_flows(demand)
+        return store
+
+    def append(self, path_id: int, link_ids: list[int], proportion: float, flow: float = 0) -> int:
+        """Adds a path given by its link ids and returns its index"""
+        if self.frozen:
+            raise RuntimeError("Can not add paths to a frozen path store.")
+        if path_id in self._path_index:
+            raise KeyError(f"Path {path_id} is already in the store.")
+        if not link_ids:
+            raise ValueError(f"Path {path_id} has no links.")
+
+        index = len(self)
+        link_indices = [self.link_index[link_id] for link_id in link_ids]
+        self._link_indices.extend(link_indices)
+        self.offsets.append(self.offsets[-1] + len(link_indices))
+        self.path_ids.append(path_id)
+        self.proportions.append(proportion)
+        self.flows.append(flow)
+
+        self._path_index[path_id] = index
+        od = self.links[link_indices[0]].tail.id, self.links[link_indices[-1]].head.id
+        self._od_paths.setdefault(od, array('i'))
+        self._od_paths[od].append(index)
+
+        self.__link_offsets = self.__link_paths = None
+        return index
+
+    def freeze(self) -> None:
+        """Marks the store as built: no more paths can be added. With trie=True the paths are moved to the trie."""
+        if self.frozen:
+            return
+        self.frozen = True
+        if not self.trie:
+            return
+
+        # Paths are added to the trie one origin connector at a time, so only one group of paths is copied out of
+        # the link indices at once
+        offsets, link_indices = self.offsets, self._link_indices
+        group_offsets, group_paths = group_indices([link_indices[offsets[index]] for index in range(len(self))],
+                                                   len(self.links))
+        trie = PrefixTrie()
+        leaves = array('i', bytes(4 * len(self)))
+        for k in range(len(self.links)):
+            group = group_paths[group_offsets[k]:group_offsets[k + 1]]
+            if not group:
+                continue
+            sequences = [link_indices[offsets[index]:offsets[index + 1]] for index in group]
+            for index, leaf in zip(group, trie.add_group(sequences)):
+                leaves[index] = leaf
+
+        self._trie, self._leaves, self._link_indices = trie, leaves, None
+
+    def link_indices(self, index: int) -> array:
+        """Returns the link indices of the path at index"""
+        if self._trie is not None:
+            return self._trie.link_indices(self._leaves[index])
+        return self._link_indices[self.offsets[index]:self.offsets[index + 1]]
+
+    def path(self, path_id: int) -> PathView:
+        """Returns the path with the given path id"""
+        return PathView(self, self._path_index[path_id])
+
+    def paths(self, origin: Node, destination: Node) -> list[PathView]:
+        """Returns the paths between the origin and the destination"""
+        return [PathView(self, index) for index in self._od_paths.get((origin.id, destination.id), ())]
+
+    @property
+    def od_pairs(self) -> Iterable[tuple[int, int]]:
+        """Yields the (origin_id, destination_id) pairs that have paths"""
+        for od in self._od_paths:
+            yield od
+
+    def update_flows(self, demand: dict[tuple[Node, Node], float]) -> None:
+        """Sets the flow of every path to its proportion of the demand of its od pair"""
+        demand_by_id = {(r.id, s.id): value for (r, s), value in demand.items()}
+        for od, indices in self._od_paths.items():
+            value = demand_by_id.get(od, 0)
+            for index in indices:
+                self.flows[index] = self.proportions[index] * value
+
+    def __build_link_paths(self) -> None:
+        """Builds the link -> paths index by grouping the path index of every link of every path by link"""
+        if self._trie is not None:
+            keys, values = array('i'), array('i')
+            for index in range(len(self)):
+                link_indices = self.link_indices(index)
+                keys.extend(link_indices)
+                values.extend([index] * len(link_indices))
+        else:
+            keys = self._link_indices
+            values = array('i', [index for index in range(len(self))
+                            for _ in range(self.offsets[index + 1] - self.offsets[index])])
+        self.__link_offsets, self.__link_paths = group_indices(keys, len(self.links), values)
+
+    def path_indices_using(self, link: Link) -> array:
+        """Returns the indices of all the paths using the link. Paths using a link twice are listed twice."""
+        if self.__link_paths is None:
+            self.__build_link_paths()
+        link_index = self.link_index[link.id]
+        return self.__link_paths[self.__link_offsets[link_index]:self.__link_offsets[link_index + 1]]
+
+    def paths_using(self, link: Link) -> list[PathView]:
+        """Returns all the paths using the link"""
+        return [PathView(self, index) for index in dict.fromkeys(self.path_indices_using(link))]
+
+    def __trie_node_flows(self) -> array:
+        """Returns the flow through every trie node, children come after their parent so one backward pass adds
+        the flow of every node to its parent"""
+        trie = self._trie
+        node_flows = array('d', bytes(8 * len(trie)))
+        for index, leaf in enumerate(self._leaves):
+            node_flows[leaf] += self.flows[index]
+        for node in range(len(trie) - 1, -1, -1):
+            if trie.parent[node] >= 0:
+                node_flows[trie.parent[node]] += node_flows[node]
+        return node_flows
+
+    def link_flow_array(self) -> array:
+        """Returns the flow on each link, aligned with the link indices of the store"""
+        link_flows = array('d', bytes(8 * len(self.links)))
+        if self._trie is not None:
+            for link_index, flow in zip(self._trie.link, self.__trie_node_flows()):
+                link_flows[link_index] += flow
+            return link_flows
+
+        flows, offsets, link_indices = self.flows, self.offsets, self._link_indices
+        for index in range(len(self)):
+            flow = flows[index]
+            if not flow:
+                continue
+            for n in range(offsets[index], offsets[index + 1]):
+                link_flows[link_indices[n]] += flow
+        return link_flows
+
+    def link_flows(self) -> dict[int, float]:
+        """Returns dict[link_id, flow] with the flow on each link"""
+        return {link.id: flow for link, flow in zip(self.links, self.link_flow_array())}
+
+    def turn_flows(self) -> dict[tuple[int, int], float]:
+        """Returns dict[(in link index, out link index), flow] with the flow of every pair of consecutive links"""
+        turn_flows: dict[tuple[int, int], float] = {}
+        if self._trie is not None:
+            trie = self._trie
+            for node, flow in enumerate(self.__trie_node_flows()):
+                if flow and trie.parent[node] >= 0:
+                    turn = trie.link[trie.parent[node]], trie.link[node]
+                    turn_flows[turn] = turn_flows.get(turn, 0) + flow
+            return turn_flows
+
+        flows, offsets, link_indices = self.flows, self.offsets, self._link_indices
+        for index in range(len(self)):
+            flow = flows[index]
+            if not flow:
+                continue
+            for n in range(offsets[index], offsets[index + 1] - 1):
+                turn = link_indices[n], link_indices[n + 1]
+                turn_flows[turn] = turn_flows.get(turn, 0) + flow
+        return turn_flows
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Returns the memory used by the store: its arrays and the trie, plus the hash tables, od keys and path index
+        arrays of the path id and od pair lookups. The int objects of the keys are not counted.
+        """
+        arrays = [self.path_ids, self.proportions, self.flows, self.offsets]
+        arrays += [self._leaves] if self._trie is not None else [self._link_indices]
+        nbytes = sum(a.itemsize * len(a) for a in arrays) + (self._trie.nbytes if self._trie is not None else 0)
+        nbytes += sys.getsizeof(self._path_index) + sys.getsizeof(self._od_paths)
+        return nbytes + sum(sys.getsizeof(od) + sys.getsizeof(indices) for od, indices in self._od_paths.items())
+
+
+if __name__ == "__main__":
+    from Graph import Graph
+
+    G = Graph(r"..\data")
+    S = PathStore.from_graph(G)
+    T = PathStore.from_graph(G, trie=True)
+    print(S, f"{S.nbytes = }", T, f"{T.nbytes = }")
@@ -0,0 +1,292 @@
+#! python3
+
+import json
+import mmap
+import struct
+import weakref
+from array import array
+from bisect import bisect_left
+from multiprocessing.shared_memory import SharedMemory
+from pickle import PickleBuffer
+from typing import Union
+
+from Graph import Graph
+from path_store import PathStore, index_by_id, group_indices
+
+
+MAGIC = b'TNGRAPH1'
+_HEADER = struct.Struct('<8sQ')         # magic, length of the json layout
+_ALIGNMENT = 8
+
+
+def _graph_arrays(net: Graph) -> dict[str, array]:
+    """
+    Returns the numeric core of the network as flat arrays. Nodes and links are indexed in order of their ids, links
+    refer to nodes and everything else refers to links by these indices.
+    """
+    store = PathStore.from_graph(net)
+    nodes, node_index = index_by_id(net.nodes)
+    links = store.links
+
+    arrays = {
+        'node_ids': array('q', [node.id for node in nodes]),
+        'node_types': array('i', [node.type for node in nodes]),
+        'node_coordinates': array('d', [c for node in nodes for c in node.coordinates]),
+        'link_ids': array('q', [link.id for link in links]),
+        'link_types': array('i', [link.type for link in links]),
+        'link_tails': array('i', [node_index[link.tail.id] for link in links]),
+        'link_heads': array('i', [node_index[link.head.id] for link in links]),
+        'link_lengths': array('d', [link.length for link in links]),
+        'link_ffspds': array('d', [link.ffspd for link in links]),
+        'link_ws': array('d', [link.w for link in links]),
+        'link_capacities': array('d', [link.capacity for link in links]),
+        'link_num_lanes': array('i', [link.num_lanes for link in links]),
+        'path_ids': store.path_ids,
+        'path_offsets': store.offsets,
+        'path_link_indices': store._link_indices,
+        'path_proportions': store.proportions,
+        'path_flows': store.flows,
+    }
+
+    for star, end in [('forward', 'link_tails'), ('reverse', 'link_heads')]:
+        arrays[f'{star}_offsets'], arrays[f'{star}_links'] = group_indices(arrays[end], len(nodes))
+
+    # Pairs are stored sorted by a single key so that lookups can bisect without building a dict on attach
+    demand = sorted((node_index[r.id] * len(nodes) + node_index[s.id], value) for (r, s), value in net.demand.items())
+    arrays['od_keys'] = array('q', [key for key, _ in demand])
+    arrays['od_demands'] = array('d', [value for _, value in demand])
+
+    exogenous = sorted((store.link_index[link.id], value) for link, value in net.exogenous_demands.items())
+    arrays['exogenous_links'] = array('i', [link_index for link_index, _ in exogenous])
+    arrays['exogenous_demands'] = array('d', [value for _, value in exogenous])
+
+    turns = sorted((store.link_index[i.id] * len(links) + store.link_index[j.id], value)
+                   for (i, j), value in net.turn_proportions.items())
+    arrays['turn_keys'] = array('q', [key for key, _ in turns])
+    arrays['turn_proportions'] = array('d', [value for _, value in turns])
+
+    return arrays
+
+
+def _layout(name: str, arrays: dict[str, array]) -> tuple[bytes, dict[str, tuple[str, int, int]], int]:
+    """Returns the header, the dict[array name, (typecode, offset, length)] and the total size in bytes"""
+    def aligned(n):
+        return -(-n // _ALIGNMENT) * _ALIGNMENT
+
+    entries: dict[str, tuple[str, int, int]] = {}
+    # The header size depends on the offsets written in it, grow it until the layout fits
+    header_size = _HEADER.size
+    while True:
+        offset = aligned(header_size)
+        for array_name, values in arrays.items():
+            entries[array_name] = (values.typecode, offset, len(values))
+            offset = aligned(offset + values.itemsize * len(values))
+        layout = json.dumps({'name': name, 'arrays': entries}).encode()
+        if _HEADER.size + len(layout) <= header_size:
+            break
+        header_size = _HEADER.size + len(layout)
+
+    return _HEADER.pack(MAGIC, len(layout)) + layout, entries, max(offset, 1)
+
+
+class SharedGraph:
+    """
+    Numeric core of a Graph (link attributes, adjacency, paths, demand and turn proportions) in one flat buffer, in
+    shared memory or in a file. Attaching to it only reads the layout header, every array is a read only memoryview
+    on the buffer, so worker processes share the data without copying or unpickling it.
+    """
+
+    def __init__(self, buffer: Union[SharedMemory, mmap.mmap], owner: bool = False):
+        self._buffer = buffer
+        self._owner = owner
+        self.__base = memoryview(buffer.buf if isinstance(buffer, SharedMemory) else buffer)
+        self.__load_views()
+
+    def __del__(self):
+        """Closes the buffer, after the slices still in use are released if there are any"""
+        if '_arrays' not in self.__dict__:
+            return
+        try:
+            self.close()
+        except BufferError:
+            weakref.finalize(self.__base, self._buffer.close)
+
+    def __load_views(self) -> None:
+        """Creates the read only views of the arrays from the layout header of the buffer"""
+        # The views are taken through a PickleBuffer so that they and every slice of them hold an export of
+        # self.__base, which close() can then release only once they are all released
+        self.__view = memoryview(PickleBuffer(self.__base)).toreadonly()
+
+        magic, layout_size = _HEADER.unpack_from(self.__view)
+        if magic != MAGIC:
+            raise ValueError(f"{self._buffer} does not hold a shared graph.")
+        layout = json.loads(bytes(self.__view[_HEADER.size:_HEADER.size + layout_size]))
+
+        self.name: str = layout['name']
+        self._arrays: dict[str, memoryview] = {
+            array_name: self.__view[offset:offset + array(typecode).itemsize * length].cast(typecode)
+            for array_name, (typecode, offset, length) in layout['arrays'].items()}
+
+    def __repr__(self):
+        return f"<SharedGraph of {self.name} nodes={self.num_nodes} links={self.num_links} paths={self.num_paths}>"
+
+    def __getattr__(self, attr):
+        """The arrays of the graph can be accessed as attributes, i.e. self.link_lengths"""
+        arrays = self.__dict__.get('_arrays', {})
+        if attr in arrays:
+            return arrays[attr]
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {attr!r}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    @classmethod
+    def create(cls, net: Graph, name: str = None) -> "SharedGraph":
+        """
+        Returns the shared graph of the network placed in a new shared memory block. The creator owns the block and
+        has to unlink it when the workers are done.
+        """
+        arrays = _graph_arrays(net)
+        header, entries, size = _layout(net.name, arrays)
+        shm = SharedMemory(name=name, create=True, size=size)
+        shm.buf[:len(header)] = header
+        for array_name, (_, offset, _) in entries.items():
+            data = arrays[array_name].tobytes()
+            shm.buf[offset:offset + len(data)] = data
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedGraph":
+        """Returns the shared graph in the shared memory block with the given name"""
+        # Only the creator should unlink the block. Before Python 3.13 it can not be left untracked, but processes
+        # started with multiprocessing share the resource tracker of their parent so it is still unlinked once.
+        try:
+            shm = SharedMemory(name=name, track=False)
+        except TypeError:
+            shm = SharedMemory(name=name)
+        return cls(shm)
+
+    @staticmethod
+    def save(net: Graph, path: str) -> None:
+        """Writes the shared graph of the network to a file that can be opened with SharedGraph.open"""
+        arrays = _graph_arrays(net)
+        header, entries, size = _layout(net.name, arrays)
+        with open(path, 'wb') as graph_file:
+            graph_file.write(header)
+            for array_name, (_, offset, _) in entries.items():
+                graph_file.write(bytes(offset - graph_file.tell()))
+                arrays[array_name].tofile(graph_file)
+            graph_file.write(bytes(size - graph_file.tell()))
+
+    @classmethod
+    def open(cls, path: str) -> "SharedGraph":
+        """Returns the shared graph memory mapped read only from a file written by SharedGraph.save"""
+        with open(path, 'rb') as graph_file:
+            return cls(mmap.mmap(graph_file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @property
+    def handle(self) -> str:
+        """Returns the name to pass to SharedGraph.attach in the workers"""
+        if not isinstance(self._buffer, SharedMemory):
+            raise TypeError("Memory mapped graphs are shared by opening their file.")
+        return self._buffer.name
+
+    def close(self) -> None:
+        """
+        Releases the views and closes the buffer. Slices taken from the arrays have to be released before, otherwise
+        BufferError is raised and the shared graph stays open and usable.
+        """
+        for view in self._arrays.values():
+            view.release()
+        self.__view.release()
+        try:
+            self.__base.release()
+        except BufferError:
+            self.__load_views()
+            raise BufferError("Slices of the shared graph arrays are still in use, release them before closing.") \
+                from None
+        self._buffer.close()
+
+    def unlink(self) -> None:
+        """Frees the shared memory block, can only be called by its creator"""
+        if not self._owner:
+            raise PermissionError("Only the creator of the shared graph can unlink it.")
+        self._buffer.unlink()
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self._arrays['node_ids'])
+
+    @property
+    def num_links(self) -> int:
+        return len(self._arrays['link_ids'])
+
+    @property
+    def num_paths(self) -> int:
+        return len(self._arrays['path_ids'])
+
+    @staticmethod
+    def __find(ids: memoryview, key: int) -> int:
+        """Returns the position of key in the sorted ids"""
+        i = bisect_left(ids, key)
+        if i == len(ids) or ids[i] != key:
+            raise KeyError(key)
+        return i
+
+    def node_index(self, node_id: int) -> int:
+        return self.__find(self._arrays['node_ids'], node_id)
+
+    def link_index(self, link_id: int) -> int:
+        return self.__find(self._arrays['link_ids'], link_id)
+
+    def forward_star(self, node_index: int) -> memoryview:
+        """Returns the indices of the links leaving the node"""
+        offsets = self._arrays['forward_offsets']
+        return self._arrays['forward_links'][offsets[node_index]:offsets[node_index + 1]]
+
+    def reverse_star(self, node_index: int) -> memoryview:
+        """Returns the indices of the links entering the node"""
+        offsets = self._arrays['reverse_offsets']
+        return self._arrays['reverse_links'][offsets[node_index]:offsets[node_index + 1]]
+
+    def path_links(self, path_index: int) -> memoryview:
+        """Returns the link indices of the path"""
+        offsets = self._arrays['path_offsets']
+        return self._arrays['path_link_indices'][offsets[path_index]:offsets[path_index + 1]]
+
+    def demand(self, origin_id: int, destination_id: int) -> float:
+        """Returns the od demand, 0 if the od pair has no demand"""
+        key = self.node_index(origin_id) * self.num_nodes + self.node_index(destination_id)
+        try:
+            return self._arrays['od_demands'][self.__find(self._arrays['od_keys'], key)]
+        except KeyError:
+            return 0
+
+    def exogenous_demand(self, link_id: int) -> float:
+        """Returns the demand entering through the link, 0 if it is not an entry link"""
+        try:
+            i = self.__find(self._arrays['exogenous_links'], self.link_index(link_id))
+        except KeyError:
+            return 0
+        return self._arrays['exogenous_demands'][i]
+
+    def turn_proportion(self, in_link_id: int, out_link_id: int) -> float:
+        """Returns the turn proportion of the move, 0 if the move is not a signal move"""
+        key = self.link_index(in_link_id) * self.num_links + self.link_index(out_link_id)
+        try:
+            return self._arrays['turn_proportions'][self.__find(self._arrays['turn_keys'], key)]
+        except KeyError:
+            return 0
+
+
+if __name__ == "__main__":
+    G = Graph(r"..\data")
+    with SharedGraph.create(G) as shared:
+        print(shared, shared.handle)
+        with SharedGraph.attach(shared.handle) as attached:
+            print(attached.link_lengths[:5].tolist())
+        shared.unlink()
@@ -0,0 +1,284 @@
+#! python3
+
+import xml.etree.ElementTree as ET
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Union
+
+from Graph import Graph
+from Link import Link
+from Move import Move
+
+
+EDGE_DATA_MEASURES = ('departed', 'arrived', 'entered', 'left', 'sampledSeconds', 'traveltime', 'speed')
+TRIPINFO_MEASURES = ('duration', 'timeLoss')
+
+
+class SumoOutput:
+    """
+    Time series aggregated from SUMO outputs, in bins of bin_width s starting at 0. Link series are keyed by measure
+    and link id, move series by (in link id, out link id). Values from outside the num_bins bins are counted in
+    self.skipped. end_time is the latest interval end, departure or arrival read, the simulated period.
+    """
+
+    def __init__(self, bin_width: float = 300, num_bins: int = 36):
+        self.bin_width = bin_width
+        self.num_bins = num_bins
+        self.replications = 1
+
+        self.link_series: dict[str, dict[int, array]] = {}
+        self.move_series: dict[tuple[int, int], array] = {}
+        self.skipped = 0
+        self.end_time = 0.0
+
+    def __repr__(self):
+        links = {link_id for series in self.link_series.values() for link_id in series}
+        return f"<SumoOutput links={len(links)} moves={len(self.move_series)} replications={self.replications}>"
+
+    def time_bin(self, t: float) -> Union[int, None]:
+        """Returns the time bin of time t, None if it is outside the time bins"""
+        b = int(t // self.bin_width)
+        return b if 0 <= b < self.num_bins else None
+
+    def __series(self, series: dict, key) -> array:
+        if key not in series:
+            series[key] = array('d', bytes(8 * self.num_bins))
+        return series[key]
+
+    def add_link_value(self, measure: str, link_id: int, t: float, value: float) -> None:
+        b = self.time_bin(t)
+        if b is None:
+            self.skipped += 1
+            return
+        self.__series(self.link_series.setdefault(measure, {}), link_id)[b] += value
+
+    def add_move_count(self, in_link_id: int, out_link_id: int, t: float, count: float) -> None:
+        b = self.time_bin(t)
+        if b is None:
+            self.skipped += 1
+            return
+        self.__series(self.move_series, (in_link_id, out_link_id))[b] += count
+
+    def series(self, measure: str, link: Link) -> list[float]:
+        """Returns the time series of the measure on the link, summed over the replications"""
+        values = self.link_series.get(measure, {}).get(link.id)
+        return values.tolist() if values is not None else [0.0] * self.num_bins
+
+    def mean_series(self, measure: str, link: Link, weight: str = 'sampledSeconds') -> list[float]:
+        """
+        Returns the time series of a mean measure (speed, traveltime, duration, timeLoss) on the link. These are
+        stored multiplied by their weight, sampledSeconds for edgeData and finished for tripinfo measures.
+        """
+        weights = self.series(weight, link)
+        return [value / w if w else 0.0 for value, w in zip(self.series(measure, link), weights)]
+
+    def merge(self, other: "SumoOutput") -> None:
+        """Adds the series of another output with the same time bins"""
+        if (other.bin_width, other.num_bins) != (self.bin_width, self.num_bins):
+            raise ValueError("Can not merge outputs with different time bins.")
+
+        for measure, series in other.link_series.items():
+            for link_id, values in series.items():
+                own = self.__series(self.link_series.setdefault(measure, {}), link_id)
+                for b, value in enumerate(values):
+                    own[b] += value
+        for key, values in other.move_series.items():
+            own = self.__series(self.move_series, key)
+            for b, value in enumerate(values):
+                own[b] += value
+        self.replications += other.replications
+        self.skipped += other.skipped
+        self.end_time = max(self.end_time, other.end_time)
+
+
+def _link_id(edge_id: str) -> Union[int, None]:
+    """Returns the link id of a SUMO edge or lane id, None for internal edges and edges not exported from a Graph"""
+    edge_id = edge_id.rsplit('_', 1)[0] if '_' in edge_id else edge_id
+    try:
+        return int(edge_id)
+    except ValueError:
+        return None
+
+
+def _iterparse(path: str, tag: str) -> Iterable[tuple[ET.Element, float, float]]:
+    """
+    Yields the elements with the tag together with the begin and end of their interval (0, 0 outside intervals).
+    Elements are cleared after use so memory does not grow with the file size.
+    """
+    begin, end = 0.0, 0.0
+    root = None
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        if root is None:
+            root = elem
+        if event == 'start':
+            if elem.tag == 'interval':
+                begin, end = float(elem.get('begin', 0)), float(elem.get('end', 0))
+            continue
+
+        if elem.tag == tag:
+            yield elem, begin, end
+            elem.clear()
+        elif elem.tag == 'interval':
+            elem.clear()
+        if elem is not root and len(root) > 1000:
+            # Drop the cleared elements still referenced by the root
+            del root[:-1]
+
+
+def read_edge_data(path: str, output: SumoOutput) -> SumoOutput:
+    """
+    Adds the edgeData (meandata) output to the per link series, each interval goes to the bin of its begin.
+    traveltime and speed are added multiplied by sampledSeconds so that they can be averaged over bins and files.
+    """
+    for edge, begin, end in _iterparse(path, 'edge'):
+        output.end_time = max(output.end_time, end)
+        link_id = _link_id(edge.get('id'))
+        if link_id is None:
+            continue
+        sampled_seconds = float(edge.get('sampledSeconds', 0))
+        for measure in EDGE_DATA_MEASURES:
+            if measure not in edge.attrib:
+                continue
+            value = float(edge.get(measure))
+            if measure in ('traveltime', 'speed'):
+                value *= sampled_seconds
+            output.add_link_value(measure, link_id, begin, value)
+    return output
+
+
+def read_tripinfo(path: str, output: SumoOutput) -> SumoOutput:
+    """
+    Adds the tripinfo output to the per link series: departures on the departure link at the departure time and
+    arrivals on the arrival link at the arrival time. Trips that did not arrive (arrival -1) have no duration or
+    timeLoss, for the others these are added together with their count, finished, on the departure link at the
+    departure time.
+    """
+    for trip, _, _ in _iterparse(path, 'tripinfo'):
+        depart = float(trip.get('depart'))
+        output.end_time = max(output.end_time, depart)
+        arrival = float(trip.get('arrival', -1))
+        output.end_time = max(output.end_time, arrival)
+        depart_link = _link_id(trip.get('departLane', ''))
+        arrival_link = _link_id(trip.get('arrivalLane', ''))
+        if depart_link is not None:
+            output.add_link_value('departures', depart_link, depart, 1)
+            if arrival >= 0:
+                output.add_link_value('finished', depart_link, depart, 1)
+                for measure in TRIPINFO_MEASURES:
+                    if measure in trip.attrib:
+                        output.add_link_value(measure, depart_link, depart, float(trip.get(measure)))
+        if arrival_link is not None and arrival >= 0:
+            output.add_link_value('arrivals', arrival_link, arrival, 1)
+    return output
+
+
+def read_turn_counts(path: str, output: SumoOutput) -> SumoOutput:
+    """Adds the edgeRelation turn counts (from or via -> to) to the per move series at the begin of each interval"""
+    for relation, begin, end in _iterparse(path, 'edgeRelation'):
+        output.end_time = max(output.end_time, end)
+        in_link = _link_id(relation.get('via', relation.get('from', '')))
+        out_link = _link_id(relation.get('to', ''))
+        if in_link is None or out_link is None or 'count' not in relation.attrib:
+            continue
+        output.add_move_count(in_link, out_link, begin, float(relation.get('count')))
+    return output
+
+
+_READERS = {'edge_data': read_edge_data, 'tripinfo': read_tripinfo, 'turn_counts': read_turn_counts}
+
+
+def read_replication(files: dict[str, str], bin_width: float = 300, num_bins: int = 36) -> SumoOutput:
+    """
+    Returns the output of one replication.
+    :param files: dict[kind, path] with kind in 'edge_data', 'tripinfo' and 'turn_counts'.
+    """
+    unknown = set(files) - set(_READERS)
+    if unknown:
+        raise KeyError(f"Unknown SUMO output kinds {sorted(unknown)}, expected {sorted(_READERS)}.")
+
+    output = SumoOutput(bin_width, num_bins)
+    for kind, path in files.items():
+        _READERS[kind](path, output)
+    return output
+
+
+class SumoOutputReader:
+    def __init__(self, net: Graph, bin_width: float = 300, num_bins: int = 36, workers: int = None):
+        """
+        :param net: network object the SUMO scenario was exported from.
+        :param bin_width: length of a time bin in s.
+        :param num_bins: number of time bins.
+        :param workers: number of processes reading replications, os.cpu_count() if None. 1 reads in this process.
+        """
+        self.G = net
+        self.bin_width = bin_width
+        self.num_bins = num_bins
+        self.workers = workers
+
+        self.moves: dict[tuple[int, int], Move] = {(move.in_link.id, move.out_link.id): move
+                                                   for move in self.G._all_possible_moves}
+
+    def __repr__(self):
+        return f"<SumoOutputReader of {self.G.name}>"
+
+    def read(self, replications: list[dict[str, str]]) -> SumoOutput:
+        """Returns the outputs of all the replications summed, each replication is read in its own process"""
+        if not replications:
+            raise ValueError("No replications to read.")
+        if self.workers == 1 or len(replications) == 1:
+            outputs = [read_replication(files, self.bin_width, self.num_bins) for files in replications]
+        else:
+            with ProcessPoolExecutor(self.workers) as executor:
+                outputs = list(executor.map(read_replication, replications, [self.bin_width] * len(replications),
+                                            [self.num_bins] * len(replications)))
+
+        output = outputs[0]
+        for other in outputs[1:]:
+            output.merge(other)
+        return output
+
+    def link_series(self, output: SumoOutput, measure: str) -> dict[Link, list[float]]:
+        """Returns the series of the measure per link of the network averaged over the replications"""
+        return {link: [value / output.replications for value in output.series(measure, link)]
+                for link in self.G.links if link.id in output.link_series.get(measure, {})}
+
+    def move_series(self, output: SumoOutput) -> dict[Move, list[float]]:
+        """Returns the turn count series per signal move of the network averaged over the replications"""
+        return {self.moves[key]: [value / output.replications for value in values]
+                for key, values in output.move_series.items() if key in self.moves}
+
+    def compare_turn_proportions(self, output: SumoOutput) -> dict[Move, tuple[float, float]]:
+        """Returns dict[move, (turn proportion of the network, turn proportion counted in SUMO)]"""
+        totals: dict[int, float] = {}
+        for (in_link_id, _), values in output.move_series.items():
+            totals[in_link_id] = totals.get(in_link_id, 0) + sum(values)
+
+        comparison = {}
+        for (in_link_id, out_link_id), move in self.moves.items():
+            count = sum(output.move_series.get((in_link_id, out_link_id), ()))
+            observed = count / totals[in_link_id] if totals.get(in_link_id) else 0
+            comparison[move] = self.G.turn_proportions.get((move.in_link, move.out_link), 0), observed
+        return comparison
+
+    def compare_exogenous_demands(self, output: SumoOutput, period: float = None) -> dict[Link, tuple[float, float]]:
+        """
+        Returns dict[entry link, (exogenous demand of the network, departures per hour in SUMO)]. Departures come
+        from tripinfo, or from the vehicles inserted on the link (departed) in edgeData if tripinfo was not read.
+        :param period: simulated period in s, output.end_time if not given.
+        """
+        measure = 'departures' if 'departures' in output.link_series else 'departed'
+        hours = (period if period is not None else output.end_time) / 3600
+        if hours <= 0:
+            raise ValueError("The simulated period is unknown, no intervals or trips were read.")
+        return {link: (demand, sum(output.series(measure, link)) / output.replications / hours)
+                for link, demand in self.G.exogenous_demands.items()}
+
+
+if __name__ == "__main__":
+    G = Graph(r"..\data")
+    reader = SumoOutputReader(G)
+    result = reader.read([{'edge_data': fr'.\austin\edge_data_{seed}.xml',
+                           'tripinfo': fr'.\austin\tripinfo_{seed}.xml',
+                           'turn_counts': fr'.\austin\turn_counts_{seed}.xml'} for seed in range(4)])
+    for move, (model, observed) in reader.compare_turn_proportions(result).items():
+        print(repr(move), f"{model:.3f}", f"{observed:.3f}")
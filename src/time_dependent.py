@@ -0,0 +1,257 @@
+#! python3
+
+import os
+from array import array
+from ast import literal_eval
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterable, Union
+
+from Graph import Graph, OD
+from Node import Node
+from Link import Link
+from Path import Path
+from path_store import index_by_id, group_indices
+
+
+@dataclass(frozen=True)
+class Vehicle:
+    id: int
+    type: int
+    origin: Node
+    destination: Node
+    departure_time: float     # in s
+    vot: float
+
+
+class DynamicPath(Path):
+    def __init__(self, id: int, path: list[Link], proportion: float, num_links: int, departure_time: float,
+                 arrival_time: float):
+        super().__init__(id, path, proportion, num_links)
+        self.departure_time: float = departure_time
+        self.arrival_time: float = arrival_time
+
+    def __repr__(self):
+        return f"DynamicPath <{self.id=}, {self.departure_time=}>"
+
+    @property
+    def travel_time(self) -> float:
+        return self.arrival_time - self.departure_time
+
+
+def load_vehicles(net: Graph, dir_path: str = None) -> list[Vehicle]:
+    """Returns the vehicles loaded from demand.txt in the given dir_path (net.dir_path by default)."""
+    demand_dir = os.path.join(dir_path if dir_path else net.dir_path, "demand.txt")
+
+    vehicles = []
+    with open(demand_dir) as demand_file:
+        next(demand_file)
+        for line in demand_file:
+            vehicle_id, type_, origin, destination, dtime, vot = [literal_eval(arg) for arg in line.split()]
+            vehicles.append(Vehicle(vehicle_id, type_, net._zones[origin], net._zones[destination], dtime, vot))
+    return vehicles
+
+
+class TravelTimeProfiles:
+    def __init__(self, net: Graph, bin_width: float = 300, num_bins: int = 36):
+        """
+        Link travel times (s) per time bin, initialized to free flow travel times. Travel times are interpolated
+        linearly between the starts of the bins and held constant after the last bin.
+        :param net: network object.
+        :param bin_width: length of a time bin in s.
+        :param num_bins: number of time bins.
+        """
+        self.bin_width = bin_width
+        self.num_bins = num_bins
+
+        self.links: list[Link]                                                      # link index -> Link
+        self.link_index: dict[int, int]
+        self.links, self.link_index = index_by_id(net.links)
+
+        # flat array, travel time of link index e in bin b is at e * num_bins + b
+        self._travel_times = array('d')
+        for link in self.links:
+            self._travel_times.extend([self.free_flow_travel_time(link)] * num_bins)
+
+    def __repr__(self):
+        return f"<TravelTimeProfiles links={len(self.links)} bins={self.num_bins} bin_width={self.bin_width}>"
+
+    @staticmethod
+    def free_flow_travel_time(link: Link) -> float:
+        """Returns the free flow travel time of the link in s"""
+        return link.length / (link.ffspd * 5280 / 3600)
+
+    def time_bin(self, t: float) -> int:
+        """Returns the time bin of time t"""
+        return min(max(int(t // self.bin_width), 0), self.num_bins - 1)
+
+    def profile(self, link: Link) -> list[float]:
+        """Returns the travel times of the link per time bin"""
+        start = self.link_index[link.id] * self.num_bins
+        return self._travel_times[start:start + self.num_bins].tolist()
+
+    def set_profile(self, link: Link, travel_times: list[float]) -> None:
+        """
+        Sets the travel times of the link per time bin. Travel times are raised where needed so that they never
+        drop by more than a bin width from one bin to the next, which keeps the link first in first out.
+        """
+        if len(travel_times) != self.num_bins:
+            raise ValueError(f"Expected {self.num_bins} travel times for {link}, got {len(travel_times)}.")
+
+        start = self.link_index[link.id] * self.num_bins
+        previous = None
+        for b, travel_time in enumerate(travel_times):
+            if travel_time < 0:
+                raise ValueError(f"Negative travel time {travel_time} for {link} in bin {b}.")
+            if previous is not None:
+                travel_time = max(travel_time, previous - self.bin_width)
+            self._travel_times[start + b] = previous = travel_time
+
+    def travel_time(self, link_index: int, t: float) -> float:
+        """Returns the travel time of the link at link_index when entered at time t"""
+        position = t / self.bin_width
+        b = int(position)
+        start = link_index * self.num_bins
+        if b < 0:
+            return self._travel_times[start]
+        if b >= self.num_bins - 1:
+            return self._travel_times[start + self.num_bins - 1]
+        low, high = self._travel_times[start + b], self._travel_times[start + b + 1]
+        return low + (high - low) * (position - b)
+
+
+class TimeDependentRouter:
+    def __init__(self, net: Graph, profiles: TravelTimeProfiles = None):
+        """
+        :param net: network object.
+        :param profiles: link travel time profiles, free flow travel times if not given.
+        """
+        self.G = net
+        self.profiles: TravelTimeProfiles = profiles if profiles is not None else TravelTimeProfiles(net)
+
+        self.nodes: list[Node]                                                      # node index -> Node
+        self.node_index: dict[int, int]
+        self.nodes, self.node_index = index_by_id(net.nodes)
+        self.__forward_offsets, self.__forward_links = group_indices(
+            [self.node_index[link.tail.id] for link in self.profiles.links], len(self.nodes))
+        self.__link_heads = array('i', [self.node_index[link.head.id] for link in self.profiles.links])
+
+        self.unrouted: list[Vehicle] = []
+
+    def __repr__(self):
+        return f"<TimeDependentRouter of {self.G.name}>"
+
+    def search(self, origin: Node, departure_time: float) -> tuple[array, array]:
+        """
+        Returns the earliest arrival time at every node and the link used to reach it (-1 if not reached) when leaving
+        origin at departure_time. Label correcting search, centroids other than the origin are not passed through.
+        """
+        nodes, travel_time = self.nodes, self.profiles.travel_time
+        offsets, forward_links, link_heads = self.__forward_offsets, self.__forward_links, self.__link_heads
+
+        arrival = array('d', [float('inf')]) * len(nodes)
+        predecessor = array('i', [-1]) * len(nodes)
+        in_queue = bytearray(len(nodes))
+
+        source = self.node_index[origin.id]
+        arrival[source] = departure_time
+        queue = deque([source])
+        in_queue[source] = 1
+
+        while queue:
+            i = queue.popleft()
+            in_queue[i] = 0
+            if nodes[i].centroid and i != source:
+                continue
+
+            t = arrival[i]
+            for n in range(offsets[i], offsets[i + 1]):
+                link_index = forward_links[n]
+                j = link_heads[link_index]
+                t_j = t + travel_time(link_index, t)
+                if t_j < arrival[j]:
+                    arrival[j] = t_j
+                    predecessor[j] = link_index
+                    if not in_queue[j]:
+                        # Small label first: nodes with earlier arrival than the queue head are scanned next
+                        if queue and t_j < arrival[queue[0]]:
+                            queue.appendleft(j)
+                        else:
+                            queue.append(j)
+                        in_queue[j] = 1
+
+        return arrival, predecessor
+
+    def __trace(self, predecessor: array, origin: Node, destination: Node) -> Union[list[Link], None]:
+        """Returns the links from origin to destination in the search tree, None if destination was not reached"""
+        links = self.profiles.links
+        path: list[Link] = []
+        j = self.node_index[destination.id]
+        while predecessor[j] >= 0:
+            link = links[predecessor[j]]
+            path.append(link)
+            j = self.node_index[link.tail.id]
+        if not path or path[-1].tail != origin:
+            return None
+        path.reverse()
+        return path
+
+    def traverse(self, path: list[Link], departure_time: float) -> float:
+        """Returns the arrival time at the end of path when leaving at departure_time"""
+        t = departure_time
+        for link in path:
+            t += self.profiles.travel_time(self.profiles.link_index[link.id], t)
+        return t
+
+    def route(self, vehicles: Iterable[Vehicle]) -> list[DynamicPath]:
+        """
+        Returns the time dependent shortest path of every vehicle. Vehicles are routed in batches of the same origin
+        and departure time bin sharing one search tree grown from the start of the bin, each path is then timed with
+        the departure time of its vehicle. Vehicles whose destination can not be reached in this call are kept in
+        self.unrouted.
+        """
+        self.unrouted = []
+        batches: dict[tuple[Node, int], list[Vehicle]] = {}
+        for vehicle in vehicles:
+            batches.setdefault((vehicle.origin, self.profiles.time_bin(vehicle.departure_time)), []).append(vehicle)
+
+        paths = []
+        for (origin, b), batch in batches.items():
+            _, predecessor = self.search(origin, b * self.profiles.bin_width)
+            for vehicle in batch:
+                links = self.__trace(predecessor, origin, vehicle.destination)
+                if links is None:
+                    self.unrouted.append(vehicle)
+                    continue
+                arrival_time = self.traverse(links, vehicle.departure_time)
+                paths.append(DynamicPath(vehicle.id, links, 1.0, len(links), vehicle.departure_time, arrival_time))
+
+        return paths
+
+    def path_sets(self, paths: Iterable[DynamicPath]) -> dict[tuple[OD, int], list[DynamicPath]]:
+        """
+        Returns the distinct paths per od pair and departure time bin. Each path is timed like the first vehicle
+        using it and its proportion is the share of the vehicles of the od pair and time bin taking it.
+        """
+        counts: dict[tuple[OD, int], dict[tuple[int, ...], list]] = {}
+        for path in paths:
+            key = ((path.origin, path.destination), self.profiles.time_bin(path.departure_time))
+            link_ids = tuple(link.id for link in path._path)
+            counts.setdefault(key, {}).setdefault(link_ids, [path, 0])[1] += 1
+
+        path_sets: dict[tuple[OD, int], list[DynamicPath]] = {}
+        for key, distinct in counts.items():
+            total = sum(count for _, count in distinct.values())
+            for path, count in distinct.values():
+                path_set_path = DynamicPath(path.id, list(path._path), count / total, len(path), path.departure_time,
+                                            path.arrival_time)
+                path_sets.setdefault(key, []).append(path_set_path)
+        return path_sets
+
+
+if __name__ == "__main__":
+    G = Graph(r"..\data")
+    router = TimeDependentRouter(G)
+    routed = router.route(load_vehicles(G))
+    print(f"{len(routed)} vehicles routed, {len(router.unrouted)} unrouted, "
+          f"{len(router.path_sets(routed))} od time bins")
@@ -0,0 +1,359 @@
+#! python3
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Callable
+
+
+CENTROID = 1000                 # node type of zones, see Node.centroid
+PROPORTION_TOLERANCE = 1e-6
+
+
+@dataclass(frozen=True, order=True)
+class Violation:
+    file: str
+    line: int
+    check: str
+    message: str
+
+    def __str__(self):
+        return f"{self.file}:{self.line}: [{self.check}] {self.message}"
+
+
+def _read_rows(dir_path: str, file_name: str, start: int = 0,
+               end: int = None) -> tuple[list[tuple], list[Violation], int]:
+    """
+    Returns the rows starting in the byte range [start, end) of a data file as (line number, values...) tuples, the
+    rows that could not be parsed and the number of lines in the range. Line numbers count from the first line of
+    the range, so they are the line numbers in the file only for start=0. A first line of the file that does not
+    start with a number is skipped as the header.
+    """
+    rows, violations = [], []
+    with open(os.path.join(dir_path, file_name), 'rb') as data_file:
+        if start > 0:
+            # The line in progress at start belongs to the previous range
+            data_file.seek(start - 1)
+            if data_file.read(1) != b'\n':
+                data_file.readline()
+        position = data_file.tell()
+        line_no = 1
+
+        while end is None or position < end:
+            line = data_file.readline()
+            if not line:
+                break
+            position += len(line)
+            values = line.decode().split()
+            if values and not (start == 0 and line_no == 1 and not values[0].lstrip('-').isdigit()):
+                try:
+                    rows.append((line_no, *_PARSERS[file_name](values)))
+                except (ValueError, IndexError) as error:
+                    violations.append(Violation(file_name, line_no, 'format', f"Could not parse line: {error}"))
+            line_no += 1
+    return rows, violations, line_no - 1
+
+
+def _parse_phase(values: list[str]) -> tuple:
+    *others, link_from, link_to = values
+    node_id, type_, seq, red, yellow, green, num_moves = [int(val) for val in others]
+    link_from = [int(link_id) for link_id in link_from.strip('{}').split(',') if link_id]
+    link_to = [int(link_id) for link_id in link_to.strip('{}').split(',') if link_id]
+    return node_id, seq, num_moves, link_from, link_to
+
+
+_PARSERS: dict[str, Callable[[list[str]], tuple]] = {
+    'nodes.txt': lambda values: (int(values[0]), int(values[1])),                                   # id, type
+    'links.txt': lambda values: (int(values[0]), int(values[2]), int(values[3])),                   # id, tail, head
+    'paths.txt': lambda values: (int(values[0]), int(values[1]), float(values[2]),                  # id, num_links,
+                                 [int(link_id) for link_id in values[3:]]),                         # proportion, links
+    'phases.txt': _parse_phase,                                                     # node, seq, num_moves, from, to
+    'static_od.txt': lambda values: (int(values[2]), int(values[3]), float(values[4])),             # r, s, demand
+    'demand.txt': lambda values: (int(values[0]), int(values[2]), int(values[3])),                  # vehicle, r, s
+}
+
+
+def check_nodes_and_links(nodes: list[tuple], links: list[tuple]) -> list[Violation]:
+    """Checks for duplicated nodes and links, links with unknown end nodes and orphan nodes"""
+    violations = []
+
+    node_lines: dict[int, int] = {}
+    for line_no, node_id, _ in nodes:
+        if node_id in node_lines:
+            violations.append(Violation('nodes.txt', line_no, 'duplicate node',
+                                        f"Node {node_id} already defined on line {node_lines[node_id]}."))
+        node_lines.setdefault(node_id, line_no)
+
+    link_lines: dict[int, int] = {}
+    end_node_lines: dict[tuple[int, int], int] = {}
+    connected: set[int] = set()
+    for line_no, link_id, i, j in links:
+        if link_id in link_lines:
+            violations.append(Violation('links.txt', line_no, 'duplicate link',
+                                        f"Link {link_id} already defined on line {link_lines[link_id]}."))
+        link_lines.setdefault(link_id, line_no)
+
+        if (i, j) in end_node_lines:
+            violations.append(Violation('links.txt', line_no, 'duplicate link',
+                                        f"Link {link_id} ({i}, {j}) duplicates the link on line "
+                                        f"{end_node_lines[i, j]}."))
+        end_node_lines.setdefault((i, j), line_no)
+
+        for node_id in (i, j):
+            if node_id not in node_lines:
+                violations.append(Violation('links.txt', line_no, 'unknown node',
+                                            f"Link {link_id} references node {node_id} not in nodes.txt."))
+        connected.update((i, j))
+
+    for node_id, line_no in node_lines.items():
+        if node_id not in connected:
+            violations.append(Violation('nodes.txt', line_no, 'orphan node', f"Node {node_id} has no links."))
+
+    return violations
+
+
+def check_paths(paths: list[tuple], links: dict[int, tuple[int, int]], zones: set[int]) -> list[Violation]:
+    """Checks the length, links and contiguity of the paths and that they start and end at zones"""
+    violations = []
+    for line_no, path_id, num_links, _, link_ids in paths:
+        if len(link_ids) != num_links:
+            violations.append(Violation('paths.txt', line_no, 'path length',
+                                        f"Path {path_id} has {len(link_ids)} links but num_links is {num_links}."))
+
+        unknown = [link_id for link_id in link_ids if link_id not in links]
+        if unknown:
+            violations.append(Violation('paths.txt', line_no, 'unknown link',
+                                        f"Path {path_id} references links {unknown} not in links.txt."))
+            continue
+        if not link_ids:
+            continue
+
+        for upstream, downstream in zip(link_ids, link_ids[1:]):
+            if links[upstream][1] != links[downstream][0]:
+                violations.append(Violation('paths.txt', line_no, 'path contiguity',
+                                            f"Path {path_id}: link {upstream} ends at node {links[upstream][1]} but "
+                                            f"link {downstream} starts at node {links[downstream][0]}."))
+
+        r, s = links[link_ids[0]][0], links[link_ids[-1]][1]
+        for end, node_id in [('origin', r), ('destination', s)]:
+            if node_id not in zones:
+                violations.append(Violation('paths.txt', line_no, 'path od',
+                                            f"Path {path_id} {end} {node_id} is not a zone."))
+    return violations
+
+
+def path_summary(paths: list[tuple], links: dict[int, tuple[int, int]]) -> tuple[list, dict]:
+    """
+    Returns the (path_id, line) of the paths and dict[od, (sum of the path proportions, first line)], the parts of
+    a path chunk needed by check_path_proportions.
+    """
+    path_lines: list[tuple[int, int]] = []
+    proportions: dict[tuple[int, int], tuple[float, int]] = {}
+    for line_no, path_id, _, proportion, link_ids in paths:
+        path_lines.append((path_id, line_no))
+        if not link_ids or link_ids[0] not in links or link_ids[-1] not in links:
+            continue
+        od = links[link_ids[0]][0], links[link_ids[-1]][1]
+        total, first_line = proportions.get(od, (0, line_no))
+        proportions[od] = total + proportion, first_line
+    return path_lines, proportions
+
+
+def check_path_proportions(summaries: list[tuple[int, list, dict]], static_od: list[tuple]) -> list[Violation]:
+    """Checks the path summaries of all the path chunks, in file order and each with the number of lines of paths.txt
+    before the chunk, for duplicated paths, that the path proportions of every od pair sum to 1 and that od pairs
+    with demand have paths"""
+    violations = []
+
+    path_lines: dict[int, int] = {}
+    proportions: dict[tuple[int, int], tuple[float, int]] = {}
+    for line_offset, chunk_path_lines, chunk_proportions in summaries:
+        for path_id, line_no in chunk_path_lines:
+            line_no += line_offset
+            if path_id in path_lines:
+                violations.append(Violation('paths.txt', line_no, 'duplicate path',
+                                            f"Path {path_id} already defined on line {path_lines[path_id]}."))
+            path_lines.setdefault(path_id, line_no)
+        for od, (total, line_no) in chunk_proportions.items():
+            previous_total, first_line = proportions.get(od, (0, line_no + line_offset))
+            proportions[od] = previous_total + total, first_line
+
+    for od, (total, first_line) in proportions.items():
+        if abs(total - 1) > PROPORTION_TOLERANCE:
+            violations.append(Violation('paths.txt', first_line, 'path proportions',
+                                        f"Path proportions of od {od} sum to {total}."))
+
+    for line_no, r, s, demand in static_od:
+        if demand > 0 and (r, s) not in proportions:
+            violations.append(Violation('static_od.txt', line_no, 'missing paths',
+                                        f"Od ({r}, {s}) has demand {demand} but no paths."))
+    return violations
+
+
+def check_phases(phases: list[tuple], links: dict[int, tuple[int, int]]) -> list[Violation]:
+    """Checks that the phase moves reference existing links connected at the phase node"""
+    violations = []
+    for line_no, node_id, seq, num_moves, link_from, link_to in phases:
+        if len(link_from) != len(link_to) or len(link_from) != num_moves:
+            violations.append(Violation('phases.txt', line_no, 'phase moves',
+                                        f"Phase {seq} of node {node_id} has num_moves {num_moves} but "
+                                        f"{len(link_from)} from links and {len(link_to)} to links."))
+
+        for i, j in zip(link_from, link_to):
+            unknown = [link_id for link_id in (i, j) if link_id not in links]
+            if unknown:
+                violations.append(Violation('phases.txt', line_no, 'unknown link',
+                                            f"Move ({i}, {j}) of node {node_id} references links {unknown} "
+                                            f"not in links.txt."))
+            elif links[i][1] != links[j][0]:
+                violations.append(Violation('phases.txt', line_no, 'move connection',
+                                            f"Move ({i}, {j}): link {i} ends at node {links[i][1]} but link {j} "
+                                            f"starts at node {links[j][0]}."))
+            elif links[i][1] != node_id:
+                violations.append(Violation('phases.txt', line_no, 'move node',
+                                            f"Move ({i}, {j}) passes node {links[i][1]} not phase node {node_id}."))
+    return violations
+
+
+def check_od_zones(static_od: list[tuple], demand: list[tuple], zones: set[int]) -> list[Violation]:
+    """Checks that the od pairs of static_od.txt and demand.txt reference zones"""
+    violations = []
+    for file_name, rows in [('static_od.txt', static_od), ('demand.txt', [row[:1] + row[2:] for row in demand])]:
+        for line_no, r, s, *_ in rows:
+            for end, node_id in [('origin', r), ('destination', s)]:
+                if node_id not in zones:
+                    violations.append(Violation(file_name, line_no, 'od zone',
+                                                f"{end.capitalize()} {node_id} is not a zone."))
+    return violations
+
+
+# Links and zones of the data set being validated, set once per worker process by _init_worker
+_context: dict = {}
+
+
+def _init_worker(links: dict[int, tuple[int, int]], zones: set[int]) -> None:
+    _context['links'], _context['zones'] = links, zones
+
+
+def _check_path_range(dir_path: str, start: int, end: int) -> tuple[list[Violation], tuple[list, dict], int]:
+    """
+    Parses and checks the paths starting in a byte range of paths.txt, returns the violations, the summary and the
+    number of lines of the range. Line numbers are relative to the range.
+    """
+    paths, violations, num_lines = _read_rows(dir_path, 'paths.txt', start, end)
+    violations += check_paths(paths, _context['links'], _context['zones'])
+    return violations, path_summary(paths, _context['links']), num_lines
+
+
+def _check_phases(dir_path: str) -> tuple[list[Violation], None]:
+    phases, violations, _ = _read_rows(dir_path, 'phases.txt')
+    return violations + check_phases(phases, _context['links']), None
+
+
+def _check_demands(dir_path: str) -> tuple[list[Violation], list[tuple]]:
+    """Parses and checks static_od.txt and demand.txt, returns the violations and the static od rows"""
+    static_od, violations, _ = _read_rows(dir_path, 'static_od.txt')
+    demand, demand_violations, _ = _read_rows(dir_path, 'demand.txt')
+    return violations + demand_violations + check_od_zones(static_od, demand, _context['zones']), static_od
+
+
+class NetworkValidator:
+    def __init__(self, path: str, workers: int = None):
+        """
+        :param path: directory with the data files.
+        :param workers: number of worker processes, os.cpu_count() if None. 1 runs every check in this process.
+        """
+        self.dir_path: str = os.path.abspath(path)
+        self.workers: int = workers if workers else os.cpu_count() or 1
+
+    def __repr__(self):
+        return f"<NetworkValidator of {self.dir_path}>"
+
+    def validate(self) -> list[Violation]:
+        """
+        Returns every violation found in the data files. nodes.txt and links.txt are checked here, every other file
+        is parsed and checked in the worker processes, paths.txt in byte ranges, so only the links, the zones and
+        the violations and summaries of the files are sent between the processes. Each byte range of paths.txt is
+        read once.
+        """
+        violations = []
+        for file_name in _PARSERS:
+            file_path = os.path.join(self.dir_path, file_name)
+            if not os.path.exists(file_path):
+                violations.append(Violation(file_name, 0, 'missing file', f"{file_name} not found in {self.dir_path}."))
+            elif os.path.getsize(file_path) == 0:
+                violations.append(Violation(file_name, 0, 'format', f"{file_name} is empty."))
+
+        def present(file_name):
+            return os.path.exists(os.path.join(self.dir_path, file_name))
+
+        def read(file_name):
+            return _read_rows(self.dir_path, file_name)[:2] if present(file_name) else ([], [])
+
+        (nodes, node_violations), (link_rows, link_violations) = read('nodes.txt'), read('links.txt')
+        violations += node_violations + link_violations + check_nodes_and_links(nodes, link_rows)
+        links = {link_id: (i, j) for _, link_id, i, j in link_rows}
+        zones = {node_id for _, node_id, type_ in nodes if type_ == CENTROID}
+
+        paths_size = os.path.getsize(os.path.join(self.dir_path, 'paths.txt')) if present('paths.txt') else 0
+        chunk_size = -(-paths_size // self.workers) or 1
+        initargs = (links, zones)
+        with ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=initargs) if self.workers > 1 \
+                else _SerialExecutor(_init_worker, initargs) as executor:
+            path_futures = [executor.submit(_check_path_range, self.dir_path, start, start + chunk_size)
+                            for start in range(0, paths_size, chunk_size)]
+            phase_future = executor.submit(_check_phases, self.dir_path) if present('phases.txt') else None
+            demand_future = executor.submit(_check_demands, self.dir_path) \
+                if present('static_od.txt') and present('demand.txt') else None
+
+            # Path chunks number their lines from 1, they are shifted by the number of lines of the chunks before
+            summaries = []
+            line_offset = 0
+            for future in path_futures:
+                path_violations, summary, num_lines = future.result()
+                violations += [replace(violation, line=violation.line + line_offset) for violation in path_violations]
+                summaries.append((line_offset, *summary))
+                line_offset += num_lines
+            if phase_future is not None:
+                violations += phase_future.result()[0]
+            static_od = []
+            if demand_future is not None:
+                demand_violations, static_od = demand_future.result()
+                violations += demand_violations
+
+        violations += check_path_proportions(summaries, static_od)
+        return sorted(violations)
+
+    def report(self) -> str:
+        """Returns the violations as text, one per line"""
+        violations = self.validate()
+        return "\n".join([str(violation) for violation in violations] + [f"{len(violations)} violations found."])
+
+
+class _SerialExecutor:
+    """Runs the submitted checks in this process with the ProcessPoolExecutor interface used by validate"""
+
+    class _Done:
+        def __init__(self, value):
+            self.value = value
+
+        def result(self):
+            return self.value
+
+    def __init__(self, initializer, initargs):
+        initializer(*initargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def submit(self, fn, *args):
+        return self._Done(fn(*args))
+
+
+if __name__ == "__main__":
+    validator = NetworkValidator(sys.argv[1] if len(sys.argv) > 1 else r"..\data")
+    print(validator.report())